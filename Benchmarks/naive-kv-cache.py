@@ -1,7 +1,13 @@
+import os
+import sys
 import time 
 from transformers import AutoModelForCausalLM , AutoTokenizer
 import torch 
 
+## repo root on the path so the profiler from pages/ can be used , run with KV_TRACE=trace.json to get a chrome trace
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pages.profiler import span
+
 if(torch.backends.mps.is_available()):
     device ="mps"
 else:
@@ -17,26 +23,30 @@ model.to(device)
 model.eval()
 
 ## generating a single token at a time 
-def generate_naive_token(prompt,max_new_tokens=20):
-    input_ids = tokenizer(prompt, return_tensors="pt").input_ids.to(device)
+def generate_naive_token(prompt,max_new_tokens=20,seq_id=None):
+    with span("tokenize", seq_id=seq_id):
+        input_ids = tokenizer(prompt, return_tensors="pt").input_ids.to(device)
     past_key_values = None # start with empty
     generated = input_ids # the stuff which is generated 
     start_time = time.perf_counter()
     prompt_len = input_ids.shape[1]
 
     for step in range(max_new_tokens):
-        with torch.no_grad():
-            outputs = model(
-                input_ids = generated if past_key_values is None else generated[:,-1:],
-                past_key_values = past_key_values,
-                use_cache=True
-            )
+        phase = "prefill" if past_key_values is None else "decode"
+        with span(f"{phase}.model_forward", seq_id=seq_id, step=step):
+            with torch.no_grad():
+                outputs = model(
+                    input_ids = generated if past_key_values is None else generated[:,-1:],
+                    past_key_values = past_key_values,
+                    use_cache=True
+                )
         
         logits = outputs.logits[:,-1,:]
         past_key_values = outputs.past_key_values ## this is the naive KV cache which grows forever
 
-        next_token = torch.argmax(logits,dim=-1,keepdim=True)
-        generated = torch.cat((generated,next_token),dim=-1)
+        with span("sampling", seq_id=seq_id, step=step):
+            next_token = torch.argmax(logits,dim=-1,keepdim=True)
+            generated = torch.cat((generated,next_token),dim=-1)
 
         total_tokens = generated.shape[-1]
         num_layers=len(past_key_values)
@@ -73,7 +83,8 @@ full_prompt = ""
 for turn,user_input in enumerate(conversation):
     full_prompt += user_input + "\n"
     print(f"\n=== Turn {turn+1} ===")
-    generated, elapsed, prompt_len = generate_naive_token(full_prompt,max_new_tokens=10)
+    with span("turn", seq_id=f"turn{turn+1}"):
+        generated, elapsed, prompt_len = generate_naive_token(full_prompt,max_new_tokens=10,seq_id=f"turn{turn+1}")
     print(f"turn latency is : {elapsed:.2f} seconds")
 
     if device=="mps":
@@ -0,0 +1,149 @@
+## reservation based admission
+## without this a request can run out of pages halfway through generation and all the compute it already used is wasted
+## a request is only admitted once the pool has reserved every page it can possibly need (prompt + max_new_tokens)
+import math
+from collections import deque
+
+## owner name for the shared overcommit headroom in PagePool.reservations
+HEADROOM = "__headroom__"
+
+
+class AdmissionController:
+    def __init__(self, page_pool, default_max_new_tokens=256, overcommit=False, quantile=0.95, min_samples=32,
+                 history=1024, block_pages=4):
+        self.page_pool = page_pool
+        self.default_max_new_tokens = default_max_new_tokens
+
+        ## overcommit : reserve for the observed output length quantile instead of the full budget
+        ## most requests stop well before max_new_tokens , so this admits more at once
+        ## a request that runs past its reservation grows in this order , none of which can fault :
+        ##   1. top up block_pages more from unreserved pages
+        ##   2. draw from a shared headroom , sized from the tail of observed output lengths , that only admitted requests can use
+        ##   3. get preempted : allocate_page returns None , the caller frees its pages and requeues it
+        ##      a preempted request is re-admitted with its full budget reserved , so it can never be preempted twice
+        self.overcommit = overcommit
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.block_pages = block_pages
+        self.output_lengths = deque(maxlen=history)
+
+        self.admitted = {} ## request_id -> pages reserved at admission
+        self.overcommitted = set() ## admitted request_ids that got less than their full budget
+
+    def budget(self, request):
+        ## requests that did not declare a budget get the default one
+        if request.max_new_tokens is None:
+            request.max_new_tokens = self.default_max_new_tokens
+        return request.max_new_tokens
+
+    def _quantile_tokens(self):
+        observed = sorted(self.output_lengths)
+        idx = min(len(observed) - 1, int(math.ceil(self.quantile * len(observed))) - 1)
+        return observed[idx]
+
+    def _can_overcommit(self):
+        return self.overcommit and len(self.output_lengths) >= self.min_samples
+
+    def expected_new_tokens(self, request):
+        max_new = self.budget(request)
+        if not self._can_overcommit() or request.preempted:
+            return max_new
+        return min(max_new, self._quantile_tokens())
+
+    def pages_for(self, request, new_tokens):
+        page_size = self.page_pool.page_size
+        total_tokens = len(request.tokens) + new_tokens
+        ## full pages of a cached prefix are shared , a partly filled last prefix page gets COW'd so it counts as new
+        ## the scheduler keeps the prefix pinned until the request has taken its own refs , so these stay shared
+        shared_pages = request.match_len // page_size
+        return math.ceil(total_tokens / page_size) - shared_pages
+
+    def pages_needed(self, request):
+        return self.pages_for(request, self.expected_new_tokens(request))
+
+    def headroom_target(self, num_overcommitted):
+        ## pages between the quantile and the longest observed output , for the share of requests expected to land in that tail
+        if num_overcommitted == 0 or not self._can_overcommit():
+            return 0
+        tail_tokens = max(self.output_lengths) - self._quantile_tokens()
+        per_request = math.ceil(tail_tokens / self.page_pool.page_size) + 1
+        expected_overflows = max(1, math.ceil((1 - self.quantile) * num_overcommitted))
+        return per_request * expected_overflows
+
+    def headroom(self):
+        return self.page_pool.reservations.get(HEADROOM, 0)
+
+    def fits(self, request):
+        ## whether the full budget fits in the pool at all (an elastic pool counts at its max size)
+        ## a request that does not can never be admitted , no matter how many others finish
+        return self.pages_for(request, self.budget(request)) <= self.page_pool.max_pages()
+
+    def try_admit(self, request):
+        if request.request_id in self.admitted:
+            return True
+        if not self.fits(request):
+            return False
+        needed = self.pages_needed(request)
+        overcommitted = needed < self.pages_for(request, self.budget(request))
+        num_overcommitted = len(self.overcommitted) + (1 if overcommitted else 0)
+        extra_headroom = max(0, self.headroom_target(num_overcommitted) - self.headroom())
+        ## never ask for more than the pool can ever hold , or a request that fits() would still be refused forever
+        extra_headroom = min(extra_headroom, max(0, self.page_pool.max_pages() - needed - self.headroom()))
+
+        ## the request's pages and the headroom growth it brings are reserved together , all or nothing
+        if not self.page_pool.reserve(request.request_id, needed + extra_headroom):
+            return False
+        if extra_headroom:
+            self.page_pool.transfer_reservation(request.request_id, HEADROOM, extra_headroom)
+        self.admitted[request.request_id] = needed
+        if overcommitted:
+            self.overcommitted.add(request.request_id)
+        print(f"[Admission] admitted {request.request_id} , reserved {needed} pages (+{extra_headroom} headroom)")
+        return True
+
+    def allocate_page(self, request):
+        ## page for an admitted request , None means it was preempted (free its pages and requeue it)
+        request_id = request.request_id
+        pool = self.page_pool
+        if pool.reservations.get(request_id, 0) <= 0:
+            block = min(self.block_pages, pool.num_available())
+            if block > 0:
+                pool.reserve(request_id, block)
+            elif not pool.transfer_reservation(HEADROOM, request_id):
+                self.preempt(request)
+                return None
+        return pool.allocate_page(owner=request_id)
+
+    def preempt(self, request):
+        print(f"[Admission] preempting {request.request_id} , it will be re-admitted with its full budget")
+        request.preempted = True
+        self._release(request)
+
+    def finish(self, request, num_generated):
+        ## record the real output length for the overcommit estimate and hand back unused reservation
+        self.output_lengths.append(num_generated)
+        return self._release(request)
+
+    def _release(self, request):
+        self.admitted.pop(request.request_id, None)
+        self.overcommitted.discard(request.request_id)
+        released = self.page_pool.release_reservation(request.request_id)
+        ## headroom shrinks back to what the remaining overcommitted requests need
+        target = self.headroom_target(len(self.overcommitted))
+        if self.headroom() > target:
+            released += self.headroom() - target
+            if target:
+                self.page_pool.reservations[HEADROOM] = target
+            else:
+                self.page_pool.release_reservation(HEADROOM)
+        return released
+
+    def stats(self):
+        return {
+            "free": self.page_pool.num_free(),
+            "reserved": self.page_pool.num_reserved(),
+            "headroom": self.headroom(),
+            "committed": self.page_pool.num_committed(),
+            "available": self.page_pool.num_available(),
+            "admitted": len(self.admitted),
+        }
@@ -1,6 +1,9 @@
 import torch 
 import math
 
+from .paged_kv_reader import gather_paged_kv_all_heads
+from .profiler import span
+
 
 def scaled_dot_product_attention(Q,K,V):
     """
@@ -13,3 +16,38 @@ def scaled_dot_product_attention(Q,K,V):
     output = torch.sum(weights.unsqueeze(1)*V,dim=0)
     return output
 
+
+def grouped_query_attention(Q,K,V):
+    """
+    GQA / MQA aware attention , works for plain MHA too (num_heads == num_kv_heads)
+    Q: [num_heads, head_dim]
+    K: [num_kv_heads, seq_len, head_dim]
+    V: [num_kv_heads, seq_len, head_dim]
+    returns: [num_heads, head_dim]
+    """
+    num_heads, head_dim = Q.shape
+    num_kv_heads = K.shape[0]
+    if num_heads % num_kv_heads != 0:
+        raise ValueError(
+            f"num_heads ({num_heads}) must be a multiple of num_kv_heads ({num_kv_heads})"
+        )
+    group = num_heads // num_kv_heads
+
+    ## query head h reads kv head h // group , so we just reshape Q into groups
+    ## instead of repeat_interleave on K/V (that would materialize group copies of the cache)
+    Q_grouped = Q.view(num_kv_heads, group, head_dim)
+    scores = torch.matmul(Q_grouped, K.transpose(1, 2))/math.sqrt(head_dim)  ## [num_kv_heads, group, seq_len]
+    weights = torch.softmax(scores,dim=-1)
+    output = torch.matmul(weights, V)  ## [num_kv_heads, group, head_dim]
+    return output.reshape(num_heads, head_dim)
+
+
+def paged_attention(Q,pages,page_table,layer_idx,seq_id=None):
+    """
+    multi head paged attention for one decode step
+    Q: [num_heads, head_dim] , pages hold [num_kv_heads] heads
+    """
+    with span("attention.gather", seq_id=seq_id, layer=layer_idx):
+        K_seq,V_seq = gather_paged_kv_all_heads(pages,page_table,layer_idx)
+    with span("attention.compute", seq_id=seq_id, layer=layer_idx):
+        return grouped_query_attention(Q,K_seq,V_seq)
@@ -0,0 +1,157 @@
+## a PagePool that is sized by a byte budget instead of a fixed num_pages
+## pages live in arena chunks (one big K and V tensor per chunk , pages are views into it)
+## the pool grows a chunk at a time when utilization crosses the high watermark and gives fully free chunks back after a sustained low period
+## page ids are chunk_idx * chunk_pages + i , so they never change while the pool grows or shrinks
+import time
+
+import torch
+
+from .page import KVPage
+from .page_pool import PagePool
+
+
+class ElasticPagePool(PagePool):
+    def __init__(self, page_size, num_layers, num_kv_heads, head_dim, device,
+                 min_bytes, max_bytes, chunk_pages=64,
+                 high_watermark=0.85, low_watermark=0.25, shrink_after_s=30.0,
+                 track_summaries=False, clock=time.monotonic, dtype=None):
+        super().__init__(0, page_size, num_layers, num_kv_heads, head_dim, device, track_summaries, dtype)
+        self.num_layers = num_layers
+        self.num_kv_heads = num_kv_heads
+        self.head_dim = head_dim
+        self.device = device
+        self.track_summaries = track_summaries
+        self.dtype = dtype if dtype is not None else torch.get_default_dtype()
+
+        self.chunk_pages = chunk_pages
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        ## seconds utilization has to stay under low_watermark before a shrink , so short dips dont thrash
+        self.shrink_after_s = shrink_after_s
+        self.clock = clock
+        self.low_since = None  ## when utilization last dropped under low_watermark , None while above it
+
+        ## K + V for every slot of every layer/head
+        element_size = torch.tensor([], dtype=self.dtype).element_size()
+        self.page_bytes = 2 * num_layers * num_kv_heads * page_size * head_dim * element_size
+        self.chunk_bytes = self.page_bytes * chunk_pages
+        self.min_chunks = max(1, -(-min_bytes // self.chunk_bytes))  ## ceil , always keep at least one chunk
+        self.max_chunks = max_bytes // self.chunk_bytes  ## floor , max_bytes is a hard cap
+        if self.max_chunks < self.min_chunks:
+            raise ValueError(
+                f"max_bytes={max_bytes} fits {self.max_chunks} chunks of {self.chunk_bytes} bytes , "
+                f"but min_bytes={min_bytes} needs {self.min_chunks} (lower chunk_pages or raise max_bytes)"
+            )
+
+        self.chunks = {} ## chunk_idx -> (K_arena, V_arena, pages)
+        for _ in range(self.min_chunks):
+            self.grow()
+
+    # ---------------- sizing ----------------
+    def capacity(self):
+        return len(self.chunks) * self.chunk_pages
+    def max_pages(self):
+        return self.max_chunks * self.chunk_pages
+    def num_bytes(self):
+        return len(self.chunks) * self.chunk_bytes
+    def utilization(self):
+        if self.capacity() == 0:
+            return 1.0
+        return (self.num_committed() + self.num_reserved()) / self.capacity()
+
+    def grow(self):
+        if len(self.chunks) >= self.max_chunks:
+            return False
+        ## reuse the lowest released chunk index first so ids stay dense
+        chunk_idx = 0
+        while chunk_idx in self.chunks:
+            chunk_idx += 1
+
+        shape = (self.chunk_pages, self.num_layers, self.num_kv_heads, self.page_size, self.head_dim)
+        K_arena = torch.zeros(shape, device=self.device, dtype=self.dtype)
+        V_arena = torch.zeros(shape, device=self.device, dtype=self.dtype)
+        if self.summaries is not None:
+            ## summary rows are only added , a released chunk keeps its (reset) rows for when it comes back
+            self.summaries.grow((chunk_idx + 1) * self.chunk_pages)
+        pages = []
+        for i in range(self.chunk_pages):
+            page_id = chunk_idx * self.chunk_pages + i
+            pages.append(KVPage(page_id, self.page_size, self.num_layers, self.num_kv_heads, self.head_dim,
+                                self.device, self.track_summaries, K=K_arena[i], V=V_arena[i], summaries=self.summaries))
+        self.chunks[chunk_idx] = (K_arena, V_arena, pages)
+        ## free list is kept sorted by page id , highest first , so pop() always hands out the lowest free id
+        ## low chunks fill first and high chunks drain , which is what lets shrink() release them
+        self.free_pages = sorted(self.free_pages + pages, key=lambda p: -p.page_id)
+        print(f"[KVPager] grew pool -> {len(self.chunks)} chunks , {self.num_bytes() / 1024**2:.2f} MB")
+        return True
+
+    def shrink(self):
+        ## release fully free chunks (highest index first) , never below min_chunks and never below what is reserved
+        released = 0
+        free_ids = {p.page_id for p in self.free_pages}
+        for chunk_idx in sorted(self.chunks, reverse=True):
+            if len(self.chunks) <= self.min_chunks:
+                break
+            _, _, pages = self.chunks[chunk_idx]
+            if not all(p.page_id in free_ids for p in pages):
+                continue
+            if self.num_available() - self.chunk_pages < 0:
+                break
+            ## dont shrink into the high watermark , the next allocation would just grow it back
+            in_use = self.num_committed() + self.num_reserved()
+            if in_use > self.high_watermark * (self.capacity() - self.chunk_pages):
+                break
+            chunk_ids = {p.page_id for p in pages}
+            self.free_pages = [p for p in self.free_pages if p.page_id not in chunk_ids]
+            del self.chunks[chunk_idx]  ## last reference to the arena , the allocator can hand it back to the OS
+            released += 1
+        if released:
+            print(f"[KVPager] shrank pool -> {len(self.chunks)} chunks , {self.num_bytes() / 1024**2:.2f} MB")
+        return released
+
+    def maybe_shrink(self):
+        ## shrink once utilization stayed low for shrink_after_s , called on every allocate/free
+        ## an idle replica gets no more page events , so whoever drives the engine should also call this on a timer
+        now = self.clock()
+        if self.utilization() >= self.low_watermark:
+            self.low_since = None
+            return 0
+        if self.low_since is None:
+            self.low_since = now
+            return 0
+        if now - self.low_since < self.shrink_after_s:
+            return 0
+        self.low_since = now
+        return self.shrink()
+
+    # ---------------- PagePool hooks ----------------
+    def _pop_free(self):
+        return self.free_pages.pop()
+    def _push_free(self, page):
+        ## binary search for where the page goes in the descending order
+        lo, hi = 0, len(self.free_pages)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.free_pages[mid].page_id > page.page_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        self.free_pages.insert(lo, page)
+
+    def reserve(self, owner, num_pages):
+        while num_pages > self.num_available() and self.grow():
+            pass
+        return super().reserve(owner, num_pages)
+
+    def allocate_page(self, owner=None):
+        if self.reservations.get(owner, 0) <= 0 and self.num_available() <= 0:
+            self.grow()
+        page = super().allocate_page(owner)
+        if self.utilization() > self.high_watermark:
+            self.grow()
+        self.maybe_shrink()
+        return page
+
+    def free_page(self, page, seq_id=None):
+        super().free_page(page, seq_id)
+        self.maybe_shrink()
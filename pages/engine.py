@@ -0,0 +1,304 @@
+## engine api , owns the model , the page pool and the prefix cache
+## nothing heavy happens at import or construction , the model is loaded on first use (or by an explicit load())
+## load() also sizes the pool from the model config and runs a warmup , so the first real request does not pay
+## for weight loading , allocator first touch or torch.compile
+import math
+import time
+
+import torch
+
+from .page_pool import PagePool
+from .page_table import PageTable
+from .prefix_cache import PrefixCache, prefix_key as make_prefix_key
+from .profiler import span
+
+## cap for the default pool size (no num_pages / kv_cache_bytes given)
+## max_batch_size full contexts is many GB for big models (llama 8B at 8k context is ~1GB of fp16 kv per sequence)
+DEFAULT_KV_CACHE_BYTES = 1 << 30
+
+
+## HF past_key_values is a Cache object on recent transformers and a tuple of (K, V) per layer on older ones
+## K/V: [batch, num_kv_heads, seq_len, head_dim]
+def _legacy_kv(past_key_values):
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return past_key_values
+
+
+def _resize_kv_batch(past_key_values, batch_size):
+    ## zero rows up to batch_size , padded rows attend over zeros and their outputs are thrown away
+    ## a cache from a bigger bucket (a sequence finished) is cut down to its first batch_size rows
+    def resize(t):
+        if t.shape[0] >= batch_size:
+            return t[:batch_size]
+        return torch.cat([t, t.new_zeros(batch_size - t.shape[0], *t.shape[1:])], dim=0)
+    resized = tuple((resize(K), resize(V)) for K, V in _legacy_kv(past_key_values))
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return type(past_key_values).from_legacy_cache(resized)
+    return resized
+
+
+class Engine:
+    def __init__(self, model_name="distilgpt2", device="cpu", dtype=torch.float32,
+                 page_size=16, num_pages=None, kv_cache_bytes=None, max_batch_size=8,
+                 compile_decode=False, batch_buckets=(1, 2, 4, 8), warmup=True,
+                 model=None, tokenizer=None):
+        self.model_name = model_name
+        self.device = device
+        self.dtype = dtype  ## model weights and kv pages , so the pool byte estimate matches what is allocated
+        self.page_size = page_size
+        self.max_batch_size = max_batch_size
+
+        ## pool size , explicit num_pages wins , then a byte budget ,
+        ## else enough for max_batch_size full contexts capped at DEFAULT_KV_CACHE_BYTES
+        self.num_pages = num_pages
+        self.kv_cache_bytes = kv_cache_bytes
+
+        self.compile_decode = compile_decode
+        ## max_batch_size is always the top bucket , so every batch the engine accepts has a bucket
+        self.batch_buckets = sorted({b for b in batch_buckets if b < max_batch_size} | {max_batch_size})
+        self.do_warmup = warmup
+
+        ## an already built model/tokenizer can be handed in (tests , or sharing weights) instead of from_pretrained
+        self._given_model = model
+        self._given_tokenizer = tokenizer
+
+        self._model = None
+        self._tokenizer = None
+        self._page_pool = None
+        self._decode_fn = None
+        self.prefix_cache = PrefixCache()
+
+    # ---------------- lazy load ----------------
+    @property
+    def model(self):
+        self.load()
+        return self._model
+    @property
+    def tokenizer(self):
+        self.load()
+        return self._tokenizer
+    @property
+    def page_pool(self):
+        self.load()
+        return self._page_pool
+
+    def load(self):
+        if self._model is not None:
+            return self
+
+        start = time.perf_counter()
+        with span("engine.load", model=self.model_name):
+            if self._given_model is not None:
+                model, tokenizer = self._given_model, self._given_tokenizer
+            else:
+                ## transformers is imported here and not at module level , importing the engine stays cheap
+                from transformers import AutoModelForCausalLM, AutoTokenizer
+                tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                model = AutoModelForCausalLM.from_pretrained(self.model_name, torch_dtype=self.dtype)
+            model.eval()
+            model.to(self.device)
+
+        ## everything is built into locals and only published once it all worked ,
+        ## so if anything here (or the warmup) fails the engine stays unloaded and the next load() retries from scratch
+        self._init_geometry(model.config)
+        page_pool = PagePool(
+            num_pages=self._pool_pages(),
+            page_size=self.page_size,
+            num_layers=self.num_layers,
+            num_kv_heads=self.num_kv_heads,
+            head_dim=self.head_dim,
+            device=self.device,
+            dtype=self.dtype,
+        )
+
+        decode_fn = self._decode_step
+        if self.compile_decode:
+            ## batch stays static (one graph per bucket) , only the kv sequence dim is marked dynamic in decode_step
+            decode_fn = torch.compile(self._decode_step, dynamic=None)
+
+        self._model, self._tokenizer, self._page_pool, self._decode_fn = model, tokenizer, page_pool, decode_fn
+
+        print(
+            f"[Engine] loaded {self.model_name} in {time.perf_counter() - start:.2f}s : "
+            f"layers={self.num_layers}, heads={self.num_heads}, kv_heads={self.num_kv_heads}, head_dim={self.head_dim}, "
+            f"pages={len(self._page_pool.free_pages)}x{self.page_size} ({len(self._page_pool.free_pages) * self.page_bytes() / 1024**2:.1f} MB)"
+        )
+        ## warmup needs the published model/pool , a failure there (torch.compile most likely) unpublishes them again
+        ## otherwise the engine would look loaded and never warm up , and the first request pays for it
+        if self.do_warmup:
+            try:
+                self.warmup()
+            except Exception:
+                self._model, self._tokenizer, self._page_pool, self._decode_fn = None, None, None, None
+                raise
+        return self
+
+    def _init_geometry(self, config):
+        self.num_layers = config.num_hidden_layers
+        self.num_heads = config.num_attention_heads
+        self.num_kv_heads = getattr(config, "num_key_value_heads", None) or self.num_heads
+        self.head_dim = getattr(config, "head_dim", None) or config.hidden_size // self.num_heads
+        self.max_context = getattr(config, "max_position_embeddings", None) or 2048
+
+    def page_bytes(self):
+        element_size = torch.tensor([], dtype=self.dtype).element_size()
+        return 2 * self.num_layers * self.num_kv_heads * self.page_size * self.head_dim * element_size
+
+    def _pool_pages(self):
+        if self.num_pages is not None:
+            return self.num_pages
+        if self.kv_cache_bytes is not None:
+            return max(1, self.kv_cache_bytes // self.page_bytes())
+        full_contexts = self.max_batch_size * math.ceil(self.max_context / self.page_size)
+        return max(1, min(full_contexts, DEFAULT_KV_CACHE_BYTES // self.page_bytes()))
+
+    # ---------------- warmup ----------------
+    def warmup(self, prompt_len=8, decode_steps=3):
+        ## one prefill + a few decode steps per batch bucket , this compiles one graph per bucket (if enabled)
+        ## and the first touch of every code path , and the pool pages are written once so their memory is faulted in
+        start = time.perf_counter()
+        with span("engine.warmup"):
+            for bucket in self.batch_buckets:
+                input_ids = torch.zeros(bucket, prompt_len, dtype=torch.long, device=self.device)
+                with torch.no_grad():
+                    past_key_values = self._model(input_ids=input_ids, use_cache=True).past_key_values
+                next_ids = input_ids[:, -1:]
+                for _ in range(decode_steps):
+                    next_ids, past_key_values = self.decode_step(next_ids, past_key_values)
+
+            for page in self._page_pool.free_pages:
+                page.K.zero_()
+                page.V.zero_()
+        print(f"[Engine] warmup done in {time.perf_counter() - start:.2f}s , buckets={self.batch_buckets}")
+
+    # ---------------- decode ----------------
+    def _decode_step(self, input_ids, past_key_values):
+        with torch.no_grad():
+            outputs = self._model(input_ids=input_ids, past_key_values=past_key_values, use_cache=True)
+        next_ids = torch.argmax(outputs.logits[:, -1, :], dim=-1, keepdim=True)
+        return next_ids, outputs.past_key_values
+
+    def bucket_for(self, batch_size):
+        for bucket in self.batch_buckets:
+            if batch_size <= bucket:
+                return bucket
+        raise ValueError(f"batch size {batch_size} is bigger than the largest bucket {self.batch_buckets[-1]}")
+
+    def decode_step(self, input_ids, past_key_values, seq_id=None):
+        ## input_ids: [batch, 1] , padded with zero rows up to bucket_for(batch) so the compiled step only sees bucket sized batches
+        ## past_key_values is padded the same way the first time and comes back bucket sized , pass it back as is next step
+        ## row i of past_key_values must be the sequence of input_ids row i , when a sequence finishes drop its row
+        ## (or move it to the end) , a cache bigger than the new bucket is cut down to its first rows
+        ## returns next_ids for the real rows only
+        self.load()
+        batch = input_ids.shape[0]
+        bucket = self.bucket_for(batch)
+        if bucket > batch:
+            input_ids = torch.cat([input_ids, input_ids.new_zeros(bucket - batch, input_ids.shape[1])], dim=0)
+        legacy = _legacy_kv(past_key_values)
+        if legacy[0][0].shape[0] != bucket:
+            past_key_values = _resize_kv_batch(past_key_values, bucket)
+            legacy = _legacy_kv(past_key_values)
+
+        with span("decode.model_forward", seq_id=seq_id, batch=batch, bucket=bucket):
+            if not self.compile_decode:
+                next_ids, past_key_values = self._decode_fn(input_ids, past_key_values)
+            else:
+                ## the kv length grows every step , so that dim is dynamic , the batch dim is kept static
+                ## (automatic dynamic off) so every bucket gets its own graph instead of one dynamic batch graph
+                for K, V in legacy:
+                    if K.shape[2] > 1:
+                        torch._dynamo.mark_dynamic(K, 2)
+                        torch._dynamo.mark_dynamic(V, 2)
+                with torch._dynamo.config.patch(automatic_dynamic_shapes=False):
+                    next_ids, past_key_values = self._decode_fn(input_ids, past_key_values)
+        return next_ids[:batch], past_key_values
+
+    # ---------------- paged kv ----------------
+    def compute_prefix(self, prefix_tokens, seq_id=None):
+        pages = []
+        page_table = PageTable()
+        current_page = None
+
+        prompt = " ".join(prefix_tokens)
+        with span("tokenize", seq_id=seq_id):
+            input_ids = self.tokenizer(
+                prompt, return_tensors="pt"
+            ).input_ids.to(self.device)
+
+        with span("prefill.model_forward", seq_id=seq_id, num_tokens=input_ids.shape[1]):
+            with torch.no_grad():
+                outputs = self.model(
+                    input_ids=input_ids,
+                    use_cache=True
+                )
+
+        past_key_values = outputs.past_key_values
+        seq_len = input_ids.shape[1]
+
+        with span("prefill.write_kv", seq_id=seq_id):
+            for token_idx in range(seq_len):
+                if current_page is None or not current_page.has_space():
+                    current_page = self.page_pool.allocate_page(owner=seq_id)
+                    pages.append(current_page)
+
+                slot = current_page.allocate_slot()
+
+                for layer_idx, kv_pair in enumerate(past_key_values):
+                    K, V = kv_pair[0], kv_pair[1]
+                    current_page.write_kv(slot, K[0, :, token_idx, :], V[0, :, token_idx, :], layer_idx=layer_idx)
+
+                page_table.add(current_page.page_id, slot)
+
+        return pages, page_table
+
+    def get_prefix(self, prefix_tokens, seq_id=None):
+        ## cached prefix -> own copy of the page list/table + a ref on each page , otherwise compute and cache it
+        prefix_key = make_prefix_key(prefix_tokens)
+        cached = self.prefix_cache.get(prefix_key, seq_id=seq_id)
+        if cached:
+            pages, page_table = list(cached[0]), cached[1].fork()
+            for p in pages:
+                p.ref_count += 1
+            return pages, page_table
+
+        pages, page_table = self.compute_prefix(prefix_tokens, seq_id=seq_id)
+        for p in pages:
+            p.ref_count = 1
+        ## cache keeps its own copy of the list/table (and its own ref on the pages)
+        self.prefix_cache.put(prefix_key, (list(pages), page_table.fork()), num_tokens=len(prefix_tokens))
+        return pages, page_table
+
+    def append_slot(self, pages, page_table, seq_id=None):
+        ## next slot for a decode token , a full last page gets a fresh page and a shared one gets COW'd first
+        current_page = pages[-1]
+        if not current_page.has_space():
+            current_page = self.page_pool.allocate_page(owner=seq_id)
+            current_page.ref_count = 1
+            pages.append(current_page)
+        elif current_page.ref_count > 1:
+            print(f"[COW] {seq_id}")
+            new_page = self.page_pool.allocate_page(owner=seq_id)
+            new_page.copy_from(current_page, seq_id=seq_id)
+
+            current_page.ref_count -= 1
+            new_page.ref_count = 1
+
+            ## earlier tokens of this page now live in the copy too , point the table at it
+            page_table.table = [
+                (new_page.page_id, s) if pid == current_page.page_id else (pid, s)
+                for pid, s in page_table.table
+            ]
+            pages[-1] = new_page
+            current_page = new_page
+
+        slot = current_page.allocate_slot()
+        page_table.add(current_page.page_id, slot)
+        return current_page, slot
+
+    def release(self, pages, seq_id=None):
+        for p in pages:
+            p.ref_count -= 1
+            if p.ref_count == 0:
+                self.page_pool.free_page(p, seq_id=seq_id)
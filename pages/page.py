@@ -1,22 +1,55 @@
 ## file for representing a single kv page that can hold n slots
 ## fixed size chunk of memory that can store KV entries for a limited nnumber of tokens
 import torch
+
+from .page_summaries import PageSummaries
+from .profiler import span, instant
 class KVPage:
-    def __init__(self,page_id,page_size,num_layers, num_heads, head_dim, device):
+    def __init__(self,page_id,page_size,num_layers, num_kv_heads, head_dim, device, track_summaries=False, K=None, V=None, dtype=None, summaries=None):
         self.page_id=page_id
         self.page_size=page_size
-        self.used=0
-        self.K = torch.zeros(
-            num_layers, num_heads, page_size, head_dim, device=device
+        ## num_kv_heads and NOT num_attention_heads , for GQA/MQA models many query heads share one kv head
+        ## so allocating per query head would waste (num_heads // num_kv_heads)x memory
+        ## K/V can be passed in as views into a bigger arena (see ElasticPagePool) , otherwise the page owns its memory
+        ## dtype should match the model's kv (fp16/bf16 pages are half the bytes) , None means torch's default dtype
+        self.K = K if K is not None else torch.zeros(
+            num_layers, num_kv_heads, page_size, head_dim, device=device, dtype=dtype
         )
-        self.V = torch.zeros(
-            num_layers, num_heads, page_size, head_dim, device=device
+        self.V = V if V is not None else torch.zeros(
+            num_layers, num_kv_heads, page_size, head_dim, device=device, dtype=dtype
         )
 
         ## Reuse and COW 
         self.ref_count =0
-    
-    
+
+        ## optional per page key summary (elementwise min/max of K per layer/head) for sparse decode
+        ## its a cheap bound on q.k for every token in this page , so we can skip pages without reading them
+        ## the summary is row page_id of a PageSummaries shared by the whole pool , a standalone page gets its own
+        self.track_summaries = track_summaries
+        self.summaries = None
+        if track_summaries:
+            self.summaries = summaries if summaries is not None else PageSummaries(
+                num_layers, num_kv_heads, head_dim, device, dtype=self.K.dtype, num_rows=page_id + 1
+            )
+        self.used=0
+
+    ## used is mirrored into the summaries so scoring can tell empty pages apart without touching the page objects
+    @property
+    def used(self):
+        return self._used
+    @used.setter
+    def used(self, value):
+        self._used = value
+        if self.summaries is not None:
+            self.summaries.used[self.page_id] = value
+
+    @property
+    def K_min(self):
+        return self.summaries.K_min[self.page_id] if self.summaries is not None else None
+    @property
+    def K_max(self):
+        return self.summaries.K_max[self.page_id] if self.summaries is not None else None
+
 
     def has_space(self):
         ## checks if the current page has some space 
@@ -29,5 +62,38 @@ class KVPage:
         slot = self.used ## basically 0 rn
         self.used+=1
         return slot 
+
+    def write_kv(self,slot,K,V,layer_idx=None):
+        ## K,V: [num_kv_heads, head_dim] for one layer , or [num_layers, num_kv_heads, head_dim] if layer_idx is None
+        ## writing through here keeps the key summary in sync , direct page.K[...] = writes will not
+        if layer_idx is None:
+            self.K[:, :, slot] = K
+            self.V[:, :, slot] = V
+            if self.track_summaries:
+                K_min, K_max = self.K_min, self.K_max
+                torch.minimum(K_min, K, out=K_min)
+                torch.maximum(K_max, K, out=K_max)
+        else:
+            self.K[layer_idx, :, slot] = K
+            self.V[layer_idx, :, slot] = V
+            if self.track_summaries:
+                K_min, K_max = self.K_min[layer_idx], self.K_max[layer_idx]
+                torch.minimum(K_min, K, out=K_min)
+                torch.maximum(K_max, K, out=K_max)
+
+    def reset_summaries(self):
+        if self.track_summaries:
+            self.summaries.reset(self.page_id)
+
+    def copy_from(self,other,seq_id=None):
+        ## used by COW , copies kv and the summary so the new page is still skippable
+        instant("page.cow_fault", seq_id=seq_id, src=other.page_id, ref_count=other.ref_count)
+        with span("page.cow", seq_id=seq_id, src=other.page_id, dst=self.page_id):
+            self.K[:] = other.K[:]
+            self.V[:] = other.V[:]
+            self.used = other.used
+            if self.track_summaries and other.track_summaries:
+                self.K_min[:] = other.K_min
+                self.K_max[:] = other.K_max
 ## this code models the memory right now 
 ## these are the properties a page will hold
@@ -1,36 +1,85 @@
 ## we have to manage the free pages too so this is for them
 ## importing our class from page
 from .page import KVPage
+from .page_summaries import PageSummaries
+from .profiler import span
 
 class PagePool:
-    def __init__(self, num_pages, page_size, num_layers, num_heads, head_dim, device):
+    def __init__(self, num_pages, page_size, num_layers, num_kv_heads, head_dim, device, track_summaries=False, dtype=None):
         self.page_size = page_size
         self.free_pages = [] ## reusable memory
         self.used_pages = {} ## currently alloacted memory 
+        self.reservations = {} ## owner -> pages promised to it but not handed out yet
+
+        ## key summaries of all pages in one tensor indexed by page id , so sparse decode scores a sequence in one op
+        self.summaries = None
+        if track_summaries:
+            self.summaries = PageSummaries(num_layers, num_kv_heads, head_dim, device, dtype=dtype, num_rows=num_pages)
 
         for i in range(num_pages):
-            self.free_pages.append(KVPage(i, page_size, num_layers, num_heads, head_dim, device)) ## i is the page id and then we have page_size
+            self.free_pages.append(KVPage(i, page_size, num_layers, num_kv_heads, head_dim, device, track_summaries, dtype=dtype, summaries=self.summaries)) ## i is the page id and then we have page_size
+
+    ## free = reserved + available , reserved pages are still on the free list but only their owner can take them
+    def num_free(self):
+        return len(self.free_pages)
+    def num_committed(self):
+        return len(self.used_pages)
+    def num_reserved(self):
+        return sum(self.reservations.values())
+    def num_available(self):
+        return len(self.free_pages) - self.num_reserved()
+    def max_pages(self):
+        ## the most pages this pool can ever hold , a request needing more than this can never be admitted
+        return len(self.free_pages) + len(self.used_pages)
+
+    def reserve(self, owner, num_pages):
+        ## all or nothing , an admitted request can then never fault halfway through its budget
+        if num_pages > self.num_available():
+            return False
+        self.reservations[owner] = self.reservations.get(owner, 0) + num_pages
+        return True
+    def release_reservation(self, owner):
+        ## whatever the owner did not use goes back to everyone
+        return self.reservations.pop(owner, 0)
+    def transfer_reservation(self, src, dst, num_pages=1):
+        ## move already reserved pages between owners , no free page changes hands
+        if self.reservations.get(src, 0) < num_pages:
+            return False
+        self.reservations[src] -= num_pages
+        self.reservations[dst] = self.reservations.get(dst, 0) + num_pages
+        return True
 
-    def allocate_page(self):
-        if not self.free_pages:
-            raise RuntimeError("we are out of pages")
-        page = self.free_pages.pop()
-        self.used_pages[page.page_id]=page
+    def allocate_page(self, owner=None):
+        with span("page.allocate", seq_id=owner):
+            if self.reservations.get(owner, 0) > 0:
+                self.reservations[owner] -= 1
+            elif self.num_available() <= 0:
+                raise RuntimeError("we are out of pages")
+            page = self._pop_free()
+            self.used_pages[page.page_id]=page
         print(f"[KVPager] Page fault -> allocated page {page.page_id}") 
         return page
-    def free_page(self, page):
+    ## free list order , a plain stack here (ElasticPagePool hands out low ids first)
+    def _pop_free(self):
+        return self.free_pages.pop()
+    def _push_free(self, page):
+        self.free_pages.append(page)
+
+    def free_page(self, page, seq_id=None):
         page_id = page.page_id
         print(f"[KVPager] Freeing page {page_id}")
 
-        # Remove from used pages
-        self.used_pages.pop(page_id, None)
+        with span("page.free", seq_id=seq_id, page_id=page_id):
+            # Remove from used pages
+            self.used_pages.pop(page_id, None)
 
-        # Reset page state
-        page.used = 0
-        page.ref_count = 0
+            # Reset page state
+            page.used = 0
+            page.ref_count = 0
+            page.reset_summaries()
 
-        # Return to free list
-        self.free_pages.append(page)
+            # Return to free list
+            self._push_free(page)
 
         print(f"[KVPager] freed page {page_id}")
 
@@ -0,0 +1,45 @@
+## key summaries for every page of a pool , in one contiguous tensor indexed by page id
+## K_min/K_max: elementwise min/max of K per layer/head , a cheap bound on q.k for every token of a page (see sparse_attention)
+## used: tokens in each page , kept next to the summaries so scoring never has to walk the KVPage objects
+## scoring a sequence is then one index_select over its page ids instead of a python loop + stack per page
+import torch
+
+
+class PageSummaries:
+    def __init__(self, num_layers, num_kv_heads, head_dim, device, dtype=None, num_rows=0):
+        self.num_layers = num_layers
+        self.num_kv_heads = num_kv_heads
+        self.head_dim = head_dim
+        self.device = device
+        self.dtype = dtype if dtype is not None else torch.get_default_dtype()
+
+        self.K_min = self._full(0, float("inf"))
+        self.K_max = self._full(0, float("-inf"))
+        self.used = torch.zeros(0, dtype=torch.long, device=device)
+        self.grow(num_rows)
+
+    def _full(self, num_rows, value):
+        shape = (num_rows, self.num_layers, self.num_kv_heads, self.head_dim)
+        return torch.full(shape, value, device=self.device, dtype=self.dtype)
+
+    def num_rows(self):
+        return self.used.shape[0]
+
+    def grow(self, num_rows):
+        ## new rows start empty , existing rows keep their values
+        ## pages index in by page id every time (no cached views) , so swapping the tensors here is safe
+        extra = num_rows - self.num_rows()
+        if extra <= 0:
+            return
+        self.K_min = torch.cat([self.K_min, self._full(extra, float("inf"))])
+        self.K_max = torch.cat([self.K_max, self._full(extra, float("-inf"))])
+        self.used = torch.cat([self.used, torch.zeros(extra, dtype=torch.long, device=self.device)])
+
+    def reset(self, page_id):
+        ## used is owned by the page (KVPage.used writes through) , only the bound is cleared here
+        self.K_min[page_id] = float("inf")
+        self.K_max[page_id] = float("-inf")
+
+    def ids_of(self, pages):
+        ## page id tensor for a page list , build it once per decode step and pass it to every layer
+        return torch.tensor([p.page_id for p in pages], dtype=torch.long, device=self.device)
@@ -6,3 +6,8 @@ class PageTable:
         self.table.append((page_id,slot))
     def lookup(self,token_index):
         return self.table[token_index]
+    def fork(self):
+        ## a request that reuses a cached prefix gets its own copy , so appending decode tokens never touches the cached table
+        forked = PageTable()
+        forked.table = list(self.table)
+        return forked
@@ -21,3 +21,25 @@ def gather_paged_kv(pages,page_table,layer_idx,head_idx):
     return K_seq,V_seq
 
 ## this is where the logical order is stored
+
+
+def gather_paged_kv_all_heads(pages,page_table,layer_idx):
+    '''
+    same as gather_paged_kv but for every kv head at once
+    this returns :
+        K_seq: [num_kv_heads,seq_len,head_dim]
+        V_seq: [num_kv_heads,seq_len,head_dim]
+    '''
+    K_list = []
+    V_list = []
+
+    for token_idx in range(len(page_table.table)):
+        page_id,slot = page_table.lookup(token_idx)
+        page = pages[page_id]
+
+        K_list.append(page.K[layer_idx,:,slot])
+        V_list.append(page.V[layer_idx,:,slot])
+    K_seq=torch.stack(K_list,dim=1)
+    V_seq=torch.stack(V_list,dim=1)
+
+    return K_seq,V_seq
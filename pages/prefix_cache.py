@@ -1,10 +1,71 @@
 ## this is a mapper which maps the prefix's hash to the list of page_ids
+from .profiler import span, instant
+
+def prefix_key(tokens):
+    ## same key for the same token prefix , used for put/get and for longest prefix matching
+    return hash(tuple(tokens))
+
 
 class PrefixCache:
     def __init__(self):
         self.cache={}
-    def get(self,prefix_key):
-        return self.cache.get(prefix_key)
-    def put(self,prefix_key,pages):
+        self.num_tokens={} ## prefix_key -> how many tokens the cached prefix covers
+        self.pins={} ## prefix_key -> number of queued requests that want this prefix (not evictable while > 0)
+    def get(self,prefix_key,seq_id=None):
+        with span("prefix_cache.get", seq_id=seq_id):
+            entry = self.cache.get(prefix_key)
+            if entry is not None:
+                ## re-insert so dict order stays least recently used -> most recently used
+                self.cache[prefix_key]=self.cache.pop(prefix_key)
+        instant("prefix_cache.hit" if entry is not None else "prefix_cache.miss", seq_id=seq_id)
+        return entry
+    def put(self,prefix_key,pages,num_tokens=None):
+        ## the cache holds its own reference on the pages , so they stay resident after the request that built them is done
+        ## pages is the (pages, page_table) tuple or just the list of pages
+        for p in self.pages_of(pages):
+            p.ref_count += 1
         self.cache[prefix_key]=pages
+        if num_tokens is not None:
+            self.num_tokens[prefix_key]=num_tokens
+
+    def pages_of(self,entry):
+        if isinstance(entry,tuple):
+            return entry[0]
+        return entry
+
+    def longest_match(self,tokens,seq_id=None):
+        ## only lengths that are actually cached are tried , so this is cheap with a handful of system prompts
+        with span("prefix_cache.longest_match", seq_id=seq_id):
+            for n in sorted(set(self.num_tokens.values()),reverse=True):
+                if n > len(tokens):
+                    continue
+                key = prefix_key(tokens[:n])
+                if key in self.cache:
+                    return key,n
+        return None,0
+
+    ## pinning , a pinned prefix is protected from eviction
+    def pin(self,prefix_key):
+        self.pins[prefix_key]=self.pins.get(prefix_key,0)+1
+    def unpin(self,prefix_key):
+        count = self.pins.get(prefix_key,0)-1
+        if count > 0:
+            self.pins[prefix_key]=count
+        else:
+            self.pins.pop(prefix_key,None)
 
+    def evict(self,page_pool):
+        ## drop the least recently used unpinned prefix , pages nobody else references go back to the pool
+        for key in self.cache:
+            if self.pins.get(key,0) > 0:
+                continue
+            entry = self.cache.pop(key)
+            self.num_tokens.pop(key,None)
+            for p in self.pages_of(entry):
+                p.ref_count -= 1
+                if p.ref_count == 0:
+                    page_pool.free_page(p)
+            instant("prefix_cache.evict", prefix=key)
+            print(f"[PrefixCache] evicted prefix {key}")
+            return True
+        return False
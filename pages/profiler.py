@@ -0,0 +1,107 @@
+## opt-in timeline profiler , exports a chrome trace (open it in chrome://tracing or ui.perfetto.dev)
+## usage:
+##     from pages.profiler import profiler, span
+##     profiler.enable()
+##     with span("prefill", seq_id="req1"):
+##         ...
+##     profiler.export_chrome_trace("trace.json")
+## or set KV_TRACE=trace.json and the trace is written when the process exits
+## when disabled span() hands back one shared no-op object , so instrumented code only pays a function call + an attribute check
+import atexit
+import json
+import os
+import threading
+import time
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter_ns()
+        self.profiler.record(self.name, self.start, end - self.start, self.args)
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.pid = os.getpid()
+
+    def enable(self):
+        self.enabled = True
+    def disable(self):
+        self.enabled = False
+    def clear(self):
+        self.events = []
+
+    def span(self, name, seq_id=None, **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        if seq_id is not None:
+            args["seq_id"] = seq_id
+        return _Span(self, name, args)
+
+    def instant(self, name, seq_id=None, **args):
+        if not self.enabled:
+            return
+        if seq_id is not None:
+            args["seq_id"] = seq_id
+        self.record(name, time.perf_counter_ns(), None, args)
+
+    def record(self, name, start_ns, dur_ns, args):
+        ## "page.allocate" -> category "page" , so chrome can filter by subsystem
+        event = {
+            "name": name,
+            "cat": name.split(".", 1)[0],
+            "ph": "X" if dur_ns is not None else "i",
+            "ts": start_ns / 1000,  ## chrome trace wants microseconds
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+            "args": {k: v if isinstance(v, (int, float, bool, type(None))) else str(v) for k, v in args.items()},
+        }
+        if dur_ns is not None:
+            event["dur"] = dur_ns / 1000
+        else:
+            event["s"] = "t"
+        self.events.append(event)
+
+    def export_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        print(f"[Profiler] wrote {len(self.events)} events to {path}")
+
+
+## one profiler per process , instrumented code goes through span() below
+profiler = Profiler()
+
+
+def span(name, seq_id=None, **args):
+    return profiler.span(name, seq_id, **args)
+
+
+def instant(name, seq_id=None, **args):
+    profiler.instant(name, seq_id, **args)
+
+
+if os.environ.get("KV_TRACE"):
+    profiler.enable()
+    atexit.register(lambda: profiler.export_chrome_trace(os.environ["KV_TRACE"]))
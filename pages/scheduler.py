@@ -0,0 +1,138 @@
+## prefix affinity , cache aware scheduling
+## arrival order alone decides who runs together , so a shared prefix can get evicted and recomputed between two requests that both wanted it
+## here every waiting request is matched against the prefix cache , requests that hit resident pages go first and are batched together
+import itertools
+
+
+class Request:
+    _arrival = itertools.count()
+
+    def __init__(self, request_id, tokens, max_new_tokens=None):
+        self.request_id = request_id
+        self.tokens = list(tokens)
+        self.max_new_tokens = max_new_tokens  ## KV budget , None means the admission controller assigns the default
+        self.arrival = next(Request._arrival)
+        self.waited = 0  ## scheduling rounds this request was passed over
+        self.preempted = False  ## set by the admission controller , a preempted request is re-admitted with its full budget
+
+        ## filled in by the scheduler
+        self.match_key = None
+        self.match_len = 0
+        self.pinned_key = None  ## prefix this request holds a pin on , until it has taken its own refs (see on_started)
+
+
+class Scheduler:
+    def __init__(self, prefix_cache, max_batch_size=4, max_wait_rounds=8, admission=None):
+        self.prefix_cache = prefix_cache
+        self.admission = admission  ## optional AdmissionController , only requests whose pages got reserved are scheduled
+        self.max_batch_size = max_batch_size
+        self.max_wait_rounds = max_wait_rounds  ## fairness cap , after this many skipped rounds a request goes first no matter what
+        self.waiting = []
+        self.rejected = [] ## requests whose full budget is bigger than the whole pool , they would block the queue forever
+
+    def add_request(self, request):
+        ## returns False (and the request goes to rejected) if it can never be admitted
+        self._refresh_match(request)
+        if self.admission is not None and not self.admission.fits(request):
+            self._reject(request)
+            return False
+        self.waiting.append(request)
+        return True
+
+    def _reject(self, request):
+        print(f"[Scheduler] rejected {request.request_id} , its budget does not fit in the pool")
+        self._unpin(request)
+        self.rejected.append(request)
+
+    def _refresh_match(self, request):
+        ## the cache changes between rounds (a prefill can populate the prefix someone else is waiting on)
+        ## so the match is recomputed and the pin moved to whatever the request matches now
+        key, n = self.prefix_cache.longest_match(request.tokens, seq_id=request.request_id)
+        if key != request.pinned_key:
+            self._unpin(request)
+            if key is not None:
+                self.prefix_cache.pin(key)  ## hot prefix pages are protected from eviction while this request is queued
+                request.pinned_key = key
+        request.match_key = key
+        request.match_len = n
+
+    def _unpin(self, request):
+        if request.pinned_key is not None:
+            self.prefix_cache.unpin(request.pinned_key)
+            request.pinned_key = None
+
+    def _priority(self, request):
+        starving = request.waited >= self.max_wait_rounds
+        ## starving first (oldest first) , then longest cached prefix , then arrival order
+        return (not starving, -request.match_len if not starving else 0, request.arrival)
+
+    def schedule(self):
+        ## picks the next batch , requests in it keep their prefix pin until on_started()
+        ## admission counted the matched prefix pages as shared , so the prefix must not be evicted before the request holds refs on it
+        if not self.waiting:
+            return []
+
+        for request in self.waiting:
+            self._refresh_match(request)
+        ## the cached prefix a request matched can be gone by now , so it may need more pages than when it was added
+        if self.admission is not None:
+            for request in [r for r in self.waiting if not self.admission.fits(r)]:
+                self.waiting.remove(request)
+                self._reject(request)
+            if not self.waiting:
+                return []
+
+        ordered = sorted(self.waiting, key=self._priority)
+
+        ## starving requests are never skipped again , they take the front of the batch
+        candidates = [r for r in ordered if r.waited >= self.max_wait_rounds]
+        if not candidates:
+            candidates = [ordered[0]]
+        anchor = candidates[0]
+
+        ## co-batch everyone who shares the anchor's cached prefix , so the prefix is read once for the whole batch
+        if anchor.match_key is not None:
+            candidates += [r for r in ordered if r.match_key == anchor.match_key and r not in candidates]
+
+        ## fill what is left in priority order
+        candidates += [r for r in ordered if r not in candidates]
+
+        batch = []
+        for request in candidates:
+            if len(batch) >= self.max_batch_size:
+                break
+            if self.admission is not None and not self.admission.try_admit(request):
+                ## a starving request that does not fit yet blocks smaller ones from jumping ahead of it forever
+                ## it is known to fit the pool (fits() above) , so it gets in once running requests release their pages
+                if request.waited >= self.max_wait_rounds:
+                    break
+                continue
+            batch.append(request)
+
+        for request in batch:
+            self.waiting.remove(request)
+        for request in self.waiting:
+            request.waited += 1
+
+        return batch
+
+    def has_waiting(self):
+        return len(self.waiting) > 0
+
+    def on_started(self, request):
+        ## the request took its own refs on the prefix pages (or computed them) , the pin is no longer needed
+        self._unpin(request)
+
+    def requeue(self, request):
+        ## preempted requests go back to the queue , waited is kept so they dont lose their place in the fairness cap
+        self._refresh_match(request)
+        if self.admission is not None and not self.admission.fits(request):
+            self._reject(request)
+            return False
+        self.waiting.append(request)
+        return True
+
+    def cancel(self, request):
+        if request in self.waiting:
+            self.waiting.remove(request)
+        self._unpin(request)
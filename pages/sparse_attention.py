@@ -0,0 +1,83 @@
+## query aware page skipping for long context decode
+## full paged attention reads every token of every page on each decode step , for 32k+ contexts that is the whole cost
+## instead we score each page with its key summary (min/max of K) and only read the top-k pages + the most recent ones
+import torch
+
+from .attention import grouped_query_attention
+from .profiler import span
+
+
+def score_pages(Q, seq_pages, layer_idx, page_ids=None):
+    """
+    upper bound of q.k over all tokens of each page, using the pool's key summaries
+    Q: [num_heads, head_dim]
+    page_ids: optional [len(seq_pages)] id tensor , built from seq_pages if not given
+    returns: [len(seq_pages)] , one score per page (max over query heads)
+    """
+    num_heads, head_dim = Q.shape
+    summaries = seq_pages[0].summaries  ## pages of one sequence share their pool's summaries
+    if page_ids is None:
+        page_ids = summaries.ids_of(seq_pages)
+    K_min = summaries.K_min[page_ids, layer_idx]  ## [num_pages, num_kv_heads, head_dim]
+    K_max = summaries.K_max[page_ids, layer_idx]
+    used = summaries.used[page_ids] > 0
+    num_kv_heads = K_min.shape[1]
+    group = num_heads // num_kv_heads
+
+    ## a summary that never saw a write is still +inf/-inf , zero it so the bound below stays finite (inf * 0 = nan)
+    empty = ~(K_min <= K_max).all(dim=-1).all(dim=-1)  ## [num_pages]
+    K_min = torch.where(empty.view(-1, 1, 1), torch.zeros_like(K_min), K_min)
+    K_max = torch.where(empty.view(-1, 1, 1), torch.zeros_like(K_max), K_max)
+
+    ## for every dim, q_d * k_d is maximised at either the min or the max key , pick whichever is bigger
+    Q_grouped = Q.view(1, num_kv_heads, group, head_dim)
+    bound = torch.maximum(Q_grouped * K_min.unsqueeze(2), Q_grouped * K_max.unsqueeze(2)).sum(dim=-1)  ## [num_pages, num_kv_heads, group]
+    scores = bound.flatten(1).max(dim=1).values
+
+    ## no summary : a page with tokens has no bound so it is always read , an empty page is never read
+    scores = torch.where(empty & used, torch.full_like(scores, float("inf")), scores)
+    scores = torch.where(empty & ~used, torch.full_like(scores, float("-inf")), scores)
+    return scores
+
+
+def select_pages(Q, seq_pages, layer_idx, top_k, num_recent=1, page_ids=None):
+    ## seq_pages is the sequence's own page list in logical order (what the caller already keeps next to its page table)
+    ## the most recent pages are always kept (local context + the page being written) , top-k of the rest by score
+    ## page_ids (summaries.ids_of(seq_pages)) can be built once per decode step and reused for every layer
+    ## returns the selected positions in seq_pages , in logical order
+    num_pages = len(seq_pages)
+    if num_pages <= top_k + num_recent:
+        return list(range(num_pages))
+
+    if seq_pages[0].summaries is None:
+        raise RuntimeError(f"page {seq_pages[0].page_id} has no key summary , create the PagePool with track_summaries=True")
+
+    num_candidates = num_pages - num_recent
+    if page_ids is not None:
+        page_ids = page_ids[:num_candidates]
+    scores = score_pages(Q, seq_pages[:num_candidates], layer_idx, page_ids)
+    top = torch.topk(scores, k=min(top_k, num_candidates)).indices.tolist()
+    return sorted(top) + list(range(num_candidates, num_pages))
+
+
+def sparse_paged_attention(Q, seq_pages, layer_idx, top_k, num_recent=1, seq_id=None, page_ids=None):
+    """
+    Q: [num_heads, head_dim]
+    seq_pages: the sequence's pages in logical order , each holding tokens in slots [0, used)
+    page_ids: optional id tensor of seq_pages , pass the same one to every layer of a decode step
+    scoring is one vectorized op over the summaries , and only the selected pages are read (one slice each)
+    returns: [num_heads, head_dim]
+    """
+    with span("attention.select_pages", seq_id=seq_id, layer=layer_idx):
+        selected = select_pages(Q, seq_pages, layer_idx, top_k, num_recent, page_ids)
+
+    with span("attention.gather", seq_id=seq_id, layer=layer_idx, pages=len(selected)):
+        K_seq = torch.cat([seq_pages[i].K[layer_idx, :, :seq_pages[i].used] for i in selected], dim=1)
+        V_seq = torch.cat([seq_pages[i].V[layer_idx, :, :seq_pages[i].used] for i in selected], dim=1)
+
+    with span("attention.compute", seq_id=seq_id, layer=layer_idx):
+        return grouped_query_attention(Q, K_seq, V_seq)
+
+## this is an approximation , attention mass that lives in skipped pages is dropped
+## the min/max bound is loose but cheap : one [num_kv_heads, head_dim] read per page instead of page_size reads
+## seq_pages assumes append only pages (COW copies keep their slots) , so a page's tokens are exactly slots [0, used)
@@ -0,0 +1,91 @@
+import torch
+from pages.page_pool import PagePool
+from pages.page_table import PageTable
+from pages.attention import paged_attention
+from pages.sparse_attention import sparse_paged_attention, select_pages, score_pages
+
+# Fake model config (small on purpose)
+num_layers = 1
+num_heads = 4
+num_kv_heads = 2
+head_dim = 8
+page_size = 4
+num_pages = 12
+device = "cpu"
+num_tokens = 30   # 8 pages , last one partly filled
+
+torch.manual_seed(0)
+
+pool = PagePool(num_pages, page_size, num_layers, num_kv_heads, head_dim, device, track_summaries=True)
+page_table = PageTable()
+pages = {}
+seq_pages = []
+
+topic = torch.randn(num_kv_heads, head_dim)
+hot_page_idx = 2
+for token_idx in range(num_tokens):
+    if not seq_pages or not seq_pages[-1].has_space():
+        seq_pages.append(pool.allocate_page())
+        pages[seq_pages[-1].page_id] = seq_pages[-1]
+    page = seq_pages[-1]
+    slot = page.allocate_slot()
+    K = 0.1 * torch.randn(num_layers, num_kv_heads, head_dim)
+    if len(seq_pages) - 1 == hot_page_idx:
+        K = K + topic   # the "retrieved fact" , lines up with the query
+    page.write_kv(slot, K, torch.randn(num_layers, num_kv_heads, head_dim))
+    page_table.add(page.page_id, slot)
+
+# summaries are the elementwise min/max of what was written
+page = seq_pages[0]
+assert torch.equal(page.K_min[0], page.K[0, :, :page.used].min(dim=1).values)
+assert torch.equal(page.K_max[0], page.K[0, :, :page.used].max(dim=1).values)
+
+# reading every page is exactly full paged attention
+Q = topic.repeat_interleave(num_heads // num_kv_heads, dim=0)
+full = paged_attention(Q, pages, page_table, layer_idx=0)
+sparse = sparse_paged_attention(Q, seq_pages, 0, top_k=len(seq_pages), num_recent=1)
+print("max abs diff (top_k >= pages):", torch.max(torch.abs(full - sparse)).item())
+assert torch.allclose(full, sparse, atol=1e-6)
+
+# the hot page is picked , together with the most recent one
+selected = select_pages(Q, seq_pages, 0, top_k=1, num_recent=1)
+print("selected pages:", selected)
+assert selected == [hot_page_idx, len(seq_pages) - 1]
+
+# summaries live in one pool tensor indexed by page id , with the used counts next to them
+assert torch.equal(pool.summaries.K_min[seq_pages[0].page_id], seq_pages[0].K_min)
+assert pool.summaries.used[seq_pages[-1].page_id].item() == seq_pages[-1].used == num_tokens % page_size
+page_ids = pool.summaries.ids_of(seq_pages)   # once per decode step , reused by every layer
+assert select_pages(Q, seq_pages, 0, top_k=1, num_recent=1, page_ids=page_ids) == selected
+
+# COW copy keeps the summary
+cow = pool.allocate_page()
+cow.copy_from(seq_pages[-1])
+assert cow.used == seq_pages[-1].used
+assert torch.equal(cow.K_min, seq_pages[-1].K_min) and torch.equal(cow.K_max, seq_pages[-1].K_max)
+
+# freeing resets it , and an empty summary never turns into inf/nan scores for real pages
+pool.free_page(cow)
+assert torch.isinf(cow.K_min).all() and torch.isinf(cow.K_max).all()
+scores = score_pages(Q, seq_pages + [cow], 0)
+print("scores:", scores)
+assert not torch.isnan(scores).any()
+assert scores[-1] == float("-inf")   # empty page is never read
+
+# a page filled with raw writes (no summary) has no bound , so it is always read
+raw = pool.allocate_page()
+slot = raw.allocate_slot()
+raw.K[0, :, slot] = torch.randn(num_kv_heads, head_dim)
+assert score_pages(Q, [raw], 0)[0] == float("inf")
+
+# an elastic pool adds summary rows as it grows , the rows already written are kept
+from pages.elastic_page_pool import ElasticPagePool
+page_bytes = 2 * num_layers * num_kv_heads * page_size * head_dim * 4  # float32
+elastic = ElasticPagePool(page_size, num_layers, num_kv_heads, head_dim, device,
+                          min_bytes=2 * page_bytes, max_bytes=4 * page_bytes, chunk_pages=2, track_summaries=True)
+first = elastic.allocate_page()
+first.write_kv(first.allocate_slot(), topic.unsqueeze(0), topic.unsqueeze(0))
+grown = [elastic.allocate_page() for _ in range(2)]
+assert len(elastic.chunks) == 2 and elastic.summaries.num_rows() == 4
+assert torch.equal(first.K_min[0], topic) and torch.equal(first.K_max[0], topic)
+assert score_pages(Q, [first] + grown, 0)[1:].eq(float("-inf")).all()
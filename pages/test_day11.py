@@ -0,0 +1,140 @@
+import torch
+from types import SimpleNamespace
+from pages.engine import Engine
+
+# Stub model / tokenizer , no download , KV is just the token id so it is easy to check where it landed
+num_layers = 2
+num_heads = 4
+num_kv_heads = 2
+head_dim = 4
+page_size = 4
+num_pages = 10
+vocab = 8
+
+
+class StubModel(torch.nn.Module):
+    def __init__(self, config):
+        super().__init__()
+        self.config = config
+
+    def forward(self, input_ids, past_key_values=None, use_cache=True):
+        b, n = input_ids.shape
+        kv = input_ids.float().view(b, 1, n, 1).expand(b, num_kv_heads, n, head_dim)
+        past = []
+        for layer_idx in range(num_layers):
+            K, V = kv + layer_idx, -kv - layer_idx
+            if past_key_values is not None:
+                K = torch.cat([past_key_values[layer_idx][0], K], dim=2)
+                V = torch.cat([past_key_values[layer_idx][1], V], dim=2)
+            past.append((K, V))
+        return SimpleNamespace(logits=torch.zeros(b, n, vocab), past_key_values=tuple(past))
+
+
+class StubTokenizer:
+    def __call__(self, prompt, return_tensors="pt"):
+        return SimpleNamespace(input_ids=torch.tensor([[i + 1 for i, _ in enumerate(prompt.split())]]))
+
+
+def stub_config(**overrides):
+    config = dict(num_hidden_layers=num_layers, num_attention_heads=num_heads, num_key_value_heads=num_kv_heads,
+                  hidden_size=num_heads * head_dim, max_position_embeddings=64)
+    config.update(overrides)
+    return SimpleNamespace(**config)
+
+
+# a failing load leaves the engine unloaded , and a later load() starts over
+bad = Engine(model=StubModel(SimpleNamespace(num_attention_heads=num_heads)), tokenizer=StubTokenizer(), warmup=False)
+try:
+    bad.load()
+    raise AssertionError("load should fail without num_hidden_layers")
+except AttributeError:
+    pass
+assert bad._model is None and bad._page_pool is None
+bad._given_model.config = stub_config()
+assert bad.load()._page_pool is not None
+
+# a failing warmup (a torch.compile error most likely) unpublishes the model too , so the next load() warms up again
+class FlakyModel(StubModel):
+    def forward(self, input_ids, past_key_values=None, use_cache=True):
+        if past_key_values is not None and self.fail:
+            raise RuntimeError("decode graph failed")
+        return super().forward(input_ids, past_key_values, use_cache)
+
+flaky_model = FlakyModel(stub_config())
+flaky_model.fail = True
+flaky = Engine(model=flaky_model, tokenizer=StubTokenizer(), page_size=page_size, num_pages=num_pages)
+try:
+    flaky.load()
+    raise AssertionError("load should fail when warmup fails")
+except RuntimeError:
+    pass
+assert flaky._model is None and flaky._page_pool is None and flaky._decode_fn is None
+flaky_model.fail = False
+assert flaky.load()._model is flaky_model
+
+engine = Engine(model=StubModel(stub_config()), tokenizer=StubTokenizer(),
+                page_size=page_size, num_pages=num_pages, batch_buckets=(1, 2, 4), warmup=False)
+pool = engine.page_pool
+
+# ---- prefix reuse + COW on a shared partial page ----
+prefix = ["a", "b", "c", "d", "e", "f"]   # 6 tokens -> one full page + one half page
+pages1, table1 = engine.get_prefix(prefix, seq_id="r1")
+shared_full, shared_partial = pages1
+assert [p.ref_count for p in pages1] == [2, 2]   # request + cache
+
+page, slot = engine.append_slot(pages1, table1, seq_id="r1")
+print("r1 pages:", [p.page_id for p in pages1], "table:", table1.table)
+assert page is not shared_partial and page is pages1[-1]
+assert shared_partial.ref_count == 1 and page.ref_count == 1
+assert slot == 2 and page.used == 3
+assert torch.equal(page.K[:, :, :2], shared_partial.K[:, :, :2])
+# every token of the COW'd page now points at the copy
+assert all(pid != shared_partial.page_id for pid, _ in table1.table)
+assert table1.table[4:] == [(page.page_id, 0), (page.page_id, 1), (page.page_id, 2)]
+
+pages2, table2 = engine.get_prefix(prefix, seq_id="r2")
+assert [p.page_id for p in pages2] == [shared_full.page_id, shared_partial.page_id]
+assert shared_full.ref_count == 3 and shared_partial.ref_count == 2
+
+# ---- full last page -> fresh page , no COW ----
+full_prefix = ["w", "x", "y", "z"]
+pages3, table3 = engine.get_prefix(full_prefix, seq_id="r3")
+prefix_page = pages3[0]
+page, slot = engine.append_slot(pages3, table3, seq_id="r3")
+assert len(pages3) == 2 and pages3[0] is prefix_page and slot == 0
+assert prefix_page.ref_count == 2   # untouched , still shared with the cache
+
+# ---- refcounts after release ----
+free_before = pool.num_free()
+engine.release(pages1, seq_id="r1")
+assert shared_full.ref_count == 2 and shared_partial.ref_count == 2   # r1 had swapped the shared partial page for its copy
+assert pool.num_free() == free_before + 1   # only r1's private COW page went back
+engine.release(pages2, seq_id="r2")
+engine.release(pages3, seq_id="r3")
+assert [shared_full.ref_count, shared_partial.ref_count, prefix_page.ref_count] == [1, 1, 1]   # cache only
+while engine.prefix_cache.evict(pool):
+    pass
+assert pool.num_free() == num_pages
+
+# ---- decode step pads to the batch bucket ----
+past = engine.model(input_ids=torch.ones(3, 5, dtype=torch.long)).past_key_values
+next_ids, past = engine.decode_step(torch.ones(3, 1, dtype=torch.long), past)
+print("next_ids:", tuple(next_ids.shape), "kv batch:", past[0][0].shape[0])
+assert next_ids.shape == (3, 1) and past[0][0].shape[0] == 4
+
+# two sequences finish , the bucket sized cache from the last step is cut down to the smaller bucket
+next_ids, past = engine.decode_step(torch.ones(1, 1, dtype=torch.long), past)
+print("next_ids:", tuple(next_ids.shape), "kv batch:", past[0][0].shape[0])
+assert next_ids.shape == (1, 1) and past[0][0].shape[0] == 1 and past[0][0].shape[2] == 7
+
+# max_batch_size is always a bucket , even when batch_buckets stops below it
+assert engine.batch_buckets == [1, 2, 4, 8] and engine.bucket_for(5) == 8
+
+# ---- pages use the engine dtype , so a byte budget is what gets allocated ----
+half = Engine(model=StubModel(stub_config()), tokenizer=StubTokenizer(), dtype=torch.float16,
+              page_size=page_size, kv_cache_bytes=8 * 1024, warmup=False)
+page = half.page_pool.free_pages[0]
+assert page.K.dtype == torch.float16
+allocated = sum(p.K.nbytes + p.V.nbytes for p in half.page_pool.free_pages)
+print("fp16 pool bytes:", allocated)
+assert allocated <= 8 * 1024 and allocated == len(half.page_pool.free_pages) * half.page_bytes()
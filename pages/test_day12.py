@@ -0,0 +1,52 @@
+import json
+import os
+import tempfile
+from pages.page_pool import PagePool
+from pages.profiler import profiler, span, _NULL_SPAN
+
+# Fake model config (small on purpose)
+num_layers = 1
+num_kv_heads = 1
+head_dim = 4
+page_size = 2
+num_pages = 4
+device = "cpu"
+
+pool = PagePool(num_pages, page_size, num_layers, num_kv_heads, head_dim, device)
+
+# disabled : span() is the shared no-op and nothing is recorded
+profiler.disable()
+profiler.clear()
+assert span("anything", seq_id="r0") is _NULL_SPAN
+page = pool.allocate_page(owner="r0")
+pool.free_page(page, seq_id="r0")
+assert profiler.events == []
+
+# enabled : page allocate / free / COW become complete events tagged with the sequence
+profiler.enable()
+src = pool.allocate_page(owner="r1")
+src.allocate_slot()
+dst = pool.allocate_page(owner="r2")
+dst.copy_from(src, seq_id="r2")
+pool.free_page(src, seq_id="r1")
+profiler.disable()
+
+names = [e["name"] for e in profiler.events]
+print("events:", names)
+for name, seq_id in [("page.allocate", "r1"), ("page.allocate", "r2"), ("page.cow", "r2"), ("page.free", "r1")]:
+    event = next(e for e in profiler.events if e["name"] == name and e["args"].get("seq_id") == seq_id)
+    assert event["ph"] == "X" and event["dur"] >= 0 and event["cat"] == "page"
+
+fault = next(e for e in profiler.events if e["name"] == "page.cow_fault")
+assert fault["ph"] == "i" and "dur" not in fault
+assert fault["args"]["seq_id"] == "r2" and fault["args"]["src"] == src.page_id
+
+# export is a valid chrome trace
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "trace.json")
+    profiler.export_chrome_trace(path)
+    with open(path) as f:
+        trace = json.load(f)
+assert isinstance(trace["traceEvents"], list) and len(trace["traceEvents"]) == len(profiler.events)
+assert [e["name"] for e in trace["traceEvents"]] == names
+profiler.clear()
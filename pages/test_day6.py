@@ -0,0 +1,53 @@
+import torch
+from pages.page_pool import PagePool
+from pages.page_table import PageTable
+from pages.paged_kv_reader import gather_paged_kv
+from pages.attention import scaled_dot_product_attention, paged_attention
+
+# GQA config , 8 query heads share 2 kv heads (group of 4)
+num_layers = 1
+num_heads = 8
+num_kv_heads = 2
+head_dim = 4
+page_size = 2
+num_pages = 4
+device = "cpu"
+num_tokens = 7
+
+torch.manual_seed(0)
+
+pool = PagePool(num_pages, page_size, num_layers, num_kv_heads, head_dim, device)
+page_table = PageTable()
+pages = {}
+current_page = None
+
+for token_idx in range(num_tokens):
+    if current_page is None or not current_page.has_space():
+        current_page = pool.allocate_page()
+        pages[current_page.page_id] = current_page
+    slot = current_page.allocate_slot()
+    current_page.K[0,:,slot]=torch.randn(num_kv_heads,head_dim)
+    current_page.V[0,:,slot]=torch.randn(num_kv_heads,head_dim)
+    page_table.add(current_page.page_id,slot)
+
+Q=torch.randn(num_heads,head_dim)
+
+# reference : every query head attends its own kv head one by one
+group = num_heads // num_kv_heads
+ref = []
+for h in range(num_heads):
+    K_seq,V_seq = gather_paged_kv(pages,page_table,layer_idx=0,head_idx=h // group)
+    ref.append(scaled_dot_product_attention(Q[h],K_seq,V_seq))
+ref = torch.stack(ref,dim=0)
+
+out = paged_attention(Q,pages,page_table,layer_idx=0)
+print("GQA paged attention o/p shape : ",out.shape)
+print("max abs diff vs per head reference : ",torch.max(torch.abs(out-ref)).item())
+assert out.shape == (num_heads,head_dim)
+assert torch.allclose(out,ref,atol=1e-6)
+
+## page only holds the kv heads , so memory per page shrinks by the group factor
+print("page K shape : ",tuple(current_page.K.shape))
+assert current_page.K.shape[1] == num_kv_heads
+
+## the kv cache is never repeated per query head , query heads are grouped onto their kv head instead
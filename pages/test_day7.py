@@ -0,0 +1,61 @@
+from pages.page_pool import PagePool
+from pages.prefix_cache import PrefixCache, prefix_key
+from pages.scheduler import Scheduler, Request
+
+# Fake model config (small on purpose)
+num_layers = 1
+num_kv_heads = 1
+head_dim = 4
+page_size = 2
+num_pages = 8
+device = "cpu"
+
+pool = PagePool(num_pages, page_size, num_layers, num_kv_heads, head_dim, device)
+cache = PrefixCache()
+
+# two system prompts , only the first one is resident in the cache
+system_a = ["You", "are", "a", "helpful", "assistant"]
+system_b = ["You", "are", "a", "pirate"]
+
+pages = [pool.allocate_page() for _ in range(3)]
+cache.put(prefix_key(system_a), pages, num_tokens=len(system_a))
+print("cached prefix pages:", [p.page_id for p in pages], "ref counts:", [p.ref_count for p in pages])
+
+scheduler = Scheduler(cache, max_batch_size=2, max_wait_rounds=2)
+r1 = Request("r1", system_b + ["hi"])
+r2 = Request("r2", system_a + ["what", "is", "kv"])
+r3 = Request("r3", system_b + ["ahoy"])
+r4 = Request("r4", system_a + ["explain", "paging"])
+for r in [r1, r2, r3, r4]:
+    scheduler.add_request(r)
+    print(f"{r.request_id} cached prefix match = {r.match_len} tokens")
+
+# the hot prefix is pinned while matching requests are queued
+assert cache.pins[prefix_key(system_a)] == 2
+assert not cache.evict(pool), "pinned prefix must not be evicted"
+
+batch = scheduler.schedule()
+print("batch 1:", [r.request_id for r in batch])
+assert [r.request_id for r in batch] == ["r2", "r4"]  # cache hits go first , co-batched
+
+# still pinned until the batch has taken its own refs on the prefix
+assert not cache.evict(pool)
+for r in batch:
+    scheduler.on_started(r)
+
+# nothing queued wants system_a anymore , it can be evicted now
+assert prefix_key(system_a) not in cache.pins
+assert cache.evict(pool)
+print("free pages after evict:", len(pool.free_pages))
+
+# fairness , a request that keeps losing gets to go once it waited max_wait_rounds
+scheduler = Scheduler(cache, max_batch_size=1, max_wait_rounds=2)
+cache.put(prefix_key(system_b), [pool.allocate_page()], num_tokens=len(system_b))
+cold = Request("cold", ["tell", "me", "a", "joke"])
+scheduler.add_request(cold)
+order = []
+for i in range(4):
+    scheduler.add_request(Request(f"hot{i}", system_b + [str(i)]))
+    order.append(scheduler.schedule()[0].request_id)
+print("fairness order:", order)
+assert "cold" in order[:3]
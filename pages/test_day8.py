@@ -0,0 +1,104 @@
+from pages.page_pool import PagePool
+from pages.prefix_cache import PrefixCache
+from pages.scheduler import Scheduler, Request
+from pages.admission import AdmissionController
+
+# Fake model config (small on purpose)
+num_layers = 1
+num_kv_heads = 1
+head_dim = 4
+page_size = 4
+num_pages = 10
+device = "cpu"
+
+pool = PagePool(num_pages, page_size, num_layers, num_kv_heads, head_dim, device)
+admission = AdmissionController(pool, default_max_new_tokens=8)
+scheduler = Scheduler(PrefixCache(), max_batch_size=4, admission=admission)
+
+a = Request("a", ["x"] * 8)                       # 8 + 8 (default budget) tokens -> 4 pages
+b = Request("b", ["y"] * 8, max_new_tokens=12)    # 8 + 12 tokens -> 5 pages
+c = Request("c", ["z"] * 4)                       # 4 + 8 tokens -> 3 pages , does not fit next to a and b
+for r in [a, b, c]:
+    scheduler.add_request(r)
+
+batch = scheduler.schedule()
+print("admitted:", [r.request_id for r in batch], admission.stats())
+assert [r.request_id for r in batch] == ["a", "b"]
+assert pool.num_reserved() == 9 and pool.num_available() == 1
+
+# a generates its whole budget , every page comes out of its reservation , so it can never fault
+for _ in range(4):
+    pool.allocate_page(owner="a")
+assert pool.num_reserved() == 5
+
+# unreserved allocations can only use what is not promised to anyone
+pool.allocate_page()
+try:
+    pool.allocate_page()
+    raise AssertionError("reserved pages must not be handed to someone else")
+except RuntimeError as e:
+    print("unreserved allocation refused:", e)
+
+# b stops early , its unused reservation goes back and c can be admitted
+for _ in range(2):
+    pool.allocate_page(owner="b")
+print("released:", admission.finish(b, num_generated=3))
+batch = scheduler.schedule()
+print("admitted:", [r.request_id for r in batch], admission.stats())
+assert [r.request_id for r in batch] == ["c"]
+
+# overcommit : once enough output lengths are observed , reserve for the p95 instead of the full budget
+pool = PagePool(num_pages, page_size, num_layers, num_kv_heads, head_dim, device)
+admission = AdmissionController(pool, default_max_new_tokens=32, overcommit=True, min_samples=4, block_pages=1)
+for n in [4, 5, 6, 8]:
+    admission.output_lengths.append(n)
+d = Request("d", ["w"] * 4)
+print("pages needed with overcommit:", admission.pages_needed(d))
+assert admission.pages_needed(d) == 3   # (4 prompt + 8 observed p95) / 4
+
+# d runs way past its reservation , it grows from free pages , then from the headroom , and then gets preempted , never an OOM
+assert admission.try_admit(d)
+print("with d admitted:", admission.stats())
+assert admission.headroom() > 0
+pages = []
+while True:
+    page = admission.allocate_page(d)
+    if page is None:
+        break
+    pages.append(page)
+print("d got", len(pages), "pages before preemption", admission.stats())
+assert len(pages) == num_pages and d.preempted
+assert pool.num_reserved() == 0
+
+# the caller frees its pages and requeues it , it comes back with the full budget reserved
+for page in pages:
+    pool.free_page(page)
+assert admission.pages_needed(d) == admission.pages_for(d, d.max_new_tokens)
+assert admission.try_admit(d) and pool.reservations["d"] == 9   # (4 prompt + 32 budget) / 4
+admission.finish(d, num_generated=32)
+
+# a request whose full budget is bigger than the whole pool is rejected up front , it must not block the queue
+pool = PagePool(num_pages, page_size, num_layers, num_kv_heads, head_dim, device)
+admission = AdmissionController(pool, default_max_new_tokens=8)
+scheduler = Scheduler(PrefixCache(), max_batch_size=4, max_wait_rounds=2, admission=admission)
+huge = Request("huge", ["h"] * 4, max_new_tokens=100)   # 4 + 100 tokens -> 26 pages , the pool has 10
+assert not admission.fits(huge) and not admission.try_admit(huge)
+assert not scheduler.add_request(huge)
+assert scheduler.rejected == [huge] and not scheduler.has_waiting()
+
+# a starving request that does fit still holds back smaller ones , until the running ones release their pages
+big = Request("big", ["b"] * 4, max_new_tokens=32)      # 4 + 32 tokens -> 9 pages
+small = [Request(f"s{i}", ["s"] * 4) for i in range(3)] # 4 + 8 tokens -> 3 pages each
+running = small[0]
+scheduler.add_request(running)
+assert scheduler.schedule() == [running]
+scheduler.add_request(big)
+for _ in range(2):
+    assert scheduler.schedule() == []   # big does not fit next to the running request , it starves
+for r in small[1:]:
+    scheduler.add_request(r)
+assert scheduler.schedule() == []       # big is starving , small ones do not jump ahead of it
+admission.finish(running, num_generated=2)
+batch = scheduler.schedule()
+print("after release:", [r.request_id for r in batch], admission.stats())
+assert [r.request_id for r in batch] == ["big"]
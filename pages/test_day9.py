@@ -0,0 +1,73 @@
+from pages.elastic_page_pool import ElasticPagePool
+
+# Fake model config (small on purpose)
+num_layers = 2
+num_kv_heads = 2
+head_dim = 4
+page_size = 4
+chunk_pages = 4
+device = "cpu"
+
+now = [0.0]  # fake clock , seconds
+page_bytes = 2 * num_layers * num_kv_heads * page_size * head_dim * 4  # float32
+pool = ElasticPagePool(
+    page_size, num_layers, num_kv_heads, head_dim, device,
+    min_bytes=chunk_pages * page_bytes, max_bytes=3 * chunk_pages * page_bytes,
+    chunk_pages=chunk_pages, high_watermark=0.75, low_watermark=0.25, shrink_after_s=10.0,
+    clock=lambda: now[0],
+)
+assert len(pool.chunks) == 1 and pool.capacity() == 4
+
+# fill past the high watermark , the pool grows by a chunk instead of failing
+pages = []
+for i in range(6):
+    page = pool.allocate_page()
+    page.K[:, :, 0] = float(page.page_id)
+    pages.append(page)
+print("chunks:", len(pool.chunks), "capacity:", pool.capacity(), "MB:", pool.num_bytes() / 1024**2)
+assert len(pool.chunks) >= 2
+
+# page ids and contents are stable across growth
+ids_before = [p.page_id for p in pages]
+for _ in range(3):
+    pool.allocate_page().ref_count = 1
+assert [p.page_id for p in pages] == ids_before
+assert all(p.K[0, 0, 0, 0].item() == p.page_id for p in pages)
+
+# max budget is a hard cap
+try:
+    while True:
+        pool.allocate_page()
+except RuntimeError as e:
+    print("capped at", pool.capacity(), "pages:", e)
+assert len(pool.chunks) == 3
+
+# free in allocation order , low ids are handed out first so the high chunks are the ones left fully free
+for page in list(pool.used_pages.values()):
+    pool.free_page(page)
+assert len(pool.chunks) == 3   # low , but not for long enough yet
+
+# idle replica , no more page events , only the timer tick
+now[0] += 11.0
+print("released chunks:", pool.maybe_shrink())
+print("chunks after idle:", len(pool.chunks), "MB:", pool.num_bytes() / 1024**2)
+assert len(pool.chunks) == 1
+assert sorted(p.page_id for p in pool.free_pages) == [0, 1, 2, 3]
+
+# steady churn reuses the lowest ids , so a grown chunk drains again
+pool.allocate_page(); pool.allocate_page(); pool.allocate_page()
+a = pool.allocate_page()   # crosses the watermark , grows chunk 1
+assert len(pool.chunks) == 2
+pool.free_page(a)
+b = pool.allocate_page()
+print("reused page:", b.page_id)
+assert b.page_id == a.page_id == 3
+
+# a budget that cannot hold min_bytes in whole chunks is refused , not silently rounded up past max_bytes
+for min_bytes, max_bytes in [(chunk_pages * page_bytes, chunk_pages * page_bytes - 1), (2 * chunk_pages * page_bytes, chunk_pages * page_bytes)]:
+    try:
+        ElasticPagePool(page_size, num_layers, num_kv_heads, head_dim, device,
+                        min_bytes=min_bytes, max_bytes=max_bytes, chunk_pages=chunk_pages)
+        raise AssertionError("inconsistent budget should raise")
+    except ValueError as e:
+        print("refused budget:", e)